@@ -0,0 +1,50 @@
+import os
+from utils import fatal_if
+
+###############################################################
+# Preflight checks
+################################################################
+DOCKER_SOCKET_PATH = '/var/run/docker.sock'
+
+fatal_if(
+    not os.path.exists(DOCKER_SOCKET_PATH),
+    'No Docker socket found at {}'.format(DOCKER_SOCKET_PATH), 1)
+
+# The registry key
+URI_REGISTRY_KEY = 'URI_DOCKER_REGISTRY'
+fatal_if(
+    not URI_REGISTRY_KEY in os.environ,
+    'Key {} not found nin environment'.format(URI_REGISTRY_KEY), 2)
+URI_REGISTRY = os.environ[URI_REGISTRY_KEY]
+
+###############################################################
+# Constants
+################################################################
+FILENAME = 'file'
+
+# Where the train archives are saved to
+TAR_FILEPATH = '/tmp/jobs'
+
+# Database of the jobs. The workers and request threads need a connection each, which the
+# in memory database (sqlite://) cannot provide, so the default is a file next to the archives
+DATABASE_URI = os.environ.get('DATABASE_URI', 'sqlite:///{}/jobs.db'.format(TAR_FILEPATH))
+
+# Upper limit for the size of uploaded train archives in bytes, unlimited if not set
+MAX_CONTENT_LENGTH = int(os.environ['MAX_CONTENT_LENGTH']) if 'MAX_CONTENT_LENGTH' in os.environ else None
+
+# Maximum number of jobs the Dockerfile is added to at once, and the number of threads doing so
+DOCKERFILE_BATCH = int(os.environ.get('DOCKERFILE_BATCH', 32))
+DOCKERFILE_WORKERS = int(os.environ.get('DOCKERFILE_WORKERS', 4))
+
+# Number of train images that are built and pushed concurrently
+PUSH_WORKERS = int(os.environ.get('PUSH_WORKERS', 4))
+
+# Whether the build context is gzip compressed before it is sent to the Docker daemon. Only worth it
+# if the Docker socket is forwarded to a remote daemon, for a local daemon it just costs CPU time
+BUILD_CONTEXT_GZIP = os.environ.get('BUILD_CONTEXT_GZIP', 'false').lower() == 'true'
+
+# Instance folder of the app, contains the Dockerfile that is added to the train archives
+INSTANCE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'instance')
+
+# Dockerfile path
+DOCKERFILE = os.path.join(INSTANCE_PATH, 'Dockerfile')
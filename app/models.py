@@ -0,0 +1,181 @@
+from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import bindparam, event, select
+from sqlalchemy.engine import Engine
+from werkzeug.utils import secure_filename
+import enum
+import sqlite3
+import string
+from config import TAR_FILEPATH
+
+db = SQLAlchemy()
+
+
+@event.listens_for(Engine, 'connect')
+def set_sqlite_pragma(dbapi_connection, connection_record):
+    """
+    Lets readers and the writer of the SQLite database proceed concurrently
+    """
+    if isinstance(dbapi_connection, sqlite3.Connection):
+        cursor = dbapi_connection.cursor()
+        cursor.execute('PRAGMA journal_mode=WAL')
+        cursor.close()
+
+
+################################################################
+# Job state enum
+################################################################
+class JobState(enum.Enum):
+    """
+    Represents the states a TrainBuilderArchive job traverses.
+    """
+    JOB_SUBMTTED = 0
+    TAR_SAVED = 1
+    DOCKERFILE_BEING_ADDED = 2
+    DOCKERFILE_ADDED = 3
+    TRAIN_BEING_CREATED = 4
+    TRAIN_SUBMITTED = 5
+    FAILED = 6
+
+
+################################################################
+# Train Archive Job
+################################################################
+class TrainArchiveJob(db.Model):
+
+    # Regular primary key
+    id = db.Column(db.Integer, primary_key=True)
+
+    # Path to the tar file
+    job_directory = db.Column(db.String(80), unique=False, nullable=True)
+
+    # TrainID, as obtained from the TrainOffie
+    file_name = db.Column(db.String(80), unique=False, nullable=False)
+
+    # State of this archive job
+    state = db.Column(db.Enum(JobState))
+
+    # Cached path to the tar file, see to_filepath
+    _filepath = None
+
+    def to_filepath(self):
+        # job_directory is always the absolute TAR_FILEPATH, so the path does not need to be normalized
+        if self._filepath is None:
+            self._filepath = f"{self.job_directory}/{self.id}.tar"
+        return self._filepath
+
+
+################################################################
+# Database functions
+################################################################
+# Maps all characters not allowed in train names to _. secure_filename only leaves ASCII characters
+ALLOWED_CHARACTERS = string.ascii_lowercase + string.digits + '_-'
+SANITIZE_TABLE = str.maketrans({chr(c): '_' for c in range(128) if chr(c) not in ALLOWED_CHARACTERS})
+
+
+def create_job(filename):
+    """Creates a new job and returns it"""
+
+    # First, make the filename secure
+    filename = secure_filename(filename)
+
+    # Now everything has to be lowercase
+    filename = filename.lower()
+
+    # All non allowed characters are replaced by _
+    filename = filename.translate(SANITIZE_TABLE)
+
+    # If the filename now ends with _, just append s
+    if filename.endswith('_'):
+        filename = filename + 's'
+
+    # Split the .tar ending from the file
+    if filename.endswith('.tar'):
+        filename = '.'.join(filename.split('.')[:-1])
+
+    # Append train_ to the name, as the naming conventions for train requires
+    if not filename.startswith("train_"):
+        filename = "train_" + filename
+
+    # Create a new trainArchiveJob
+    job = TrainArchiveJob(
+        job_directory=TAR_FILEPATH,
+        file_name=filename,
+        state=JobState.JOB_SUBMTTED
+    )
+    db.session.add(job)
+    db.session.commit()
+    return job
+
+
+def update_job_state(job, state):
+    """
+    Updates the job state in the persistence
+    """
+    # job has been loaded by this session, so it does not need to be merged
+    job.state = state
+    db.session.commit()
+
+
+################################################################
+# Statements for the state transitions of the workers. They bypass
+# the ORM, as the workers only ever change the state of a job
+################################################################
+job_table = TrainArchiveJob.__table__
+
+SET_JOB_STATE = job_table.update() \
+    .where(job_table.c.id == bindparam('job_id')) \
+    .values(state=bindparam('to_state'))
+
+# Only matches if the job is still in from_state
+CLAIM_JOB = SET_JOB_STATE.where(job_table.c.state == bindparam('from_state'))
+
+
+def set_job_state(job_id, state):
+    """
+    Updates the state of the job with the given id in the persistence
+    """
+    set_job_states({job_id: state})
+
+
+def set_job_states(job_states):
+    """
+    Updates the states of several jobs in one transaction. job_states maps job ids to their new state
+    """
+    if not job_states:
+        return
+    db.session.execute(SET_JOB_STATE, [{'job_id': job_id, 'to_state': state}
+                                       for job_id, state in job_states.items()])
+    db.session.commit()
+
+
+def claim_jobs(from_state, while_state, limit):
+    """
+    Claims up to limit jobs in from_state for processing and returns their ids.
+    The SELECT does not lock anything, a job is only claimed if it is still in from_state
+    when its UPDATE runs, so jobs claimed by another worker in the meantime are skipped.
+    All claims are committed at once.
+    """
+    candidates = db.session.execute(
+        select([job_table.c.id]).where(job_table.c.state == from_state).limit(limit)).fetchall()
+    claimed = [job_id for (job_id,) in candidates
+               if db.session.execute(CLAIM_JOB, {'job_id': job_id,
+                                                 'from_state': from_state,
+                                                 'to_state': while_state}).rowcount == 1]
+    db.session.commit()
+    return claimed
+
+
+def job_ids_in_state(state):
+    """
+    Returns the ids of all jobs in the given state
+    """
+    return [job_id for (job_id,) in db.session.execute(
+        select([job_table.c.id]).where(job_table.c.state == state))]
+
+
+def move_jobs(from_state, to_state):
+    """
+    Moves all jobs in from_state to to_state
+    """
+    db.session.execute(job_table.update().where(job_table.c.state == from_state).values(state=to_state))
+    db.session.commit()
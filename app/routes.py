@@ -0,0 +1,90 @@
+from flask import Blueprint, Request, Response
+from flask import request, jsonify
+import os
+import tempfile
+from config import FILENAME, TAR_FILEPATH
+from models import JobState, create_job, update_job_state
+from utils import POST_ONLY, allowed_file
+from workers import dockerfile_q
+
+
+class TrainArchiveRequest(Request):
+    """
+    Streams uploaded files directly into TAR_FILEPATH instead of Werkzeug's
+    spooled temporary file, so saving the train archive is a rename rather than a second copy
+    """
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+
+        # All files created for this request, also those the parser drops on a truncated body
+        self.uploads = []
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        upload = tempfile.NamedTemporaryFile('wb+', dir=TAR_FILEPATH, suffix='.part', delete=False)
+        self.uploads.append(upload)
+        return upload
+
+
+train_archives = Blueprint('train_archives', __name__)
+
+
+################################################################
+# Responses
+################################################################
+def failure(msg):
+    return jsonify(success=False, msg=msg), 201
+
+
+# The body of a successful response never changes, so it is only encoded once
+SUCCESS_BODY = b'{"success": true}'
+
+
+def success():
+    return Response(SUCCESS_BODY, status=200, mimetype='application/json', direct_passthrough=True)
+
+
+################################################################
+# Route for adding new train archives
+################################################################
+@train_archives.route('/', methods=POST_ONLY)
+def index():
+
+    # check if the post request has the file part
+    if FILENAME not in request.files:
+        return failure("Field with name {} was not submitted".format(FILENAME))
+
+    file = request.files[FILENAME]
+
+    # if user does not select file, browser also
+    # submit a empty part without filename
+    if file:
+        if file.filename == '':
+            return failure("No file was selected")
+
+        if allowed_file(file.filename, 'tar'):
+
+            # Create a new job for this tar file
+            job = create_job(file.filename)
+            filepath = job.to_filepath()
+            print("Saving to: {}".format(filepath))
+            file.close()
+            os.replace(file.stream.name, filepath)
+
+            # Update the job now that the tarfile has been saved
+            update_job_state(job, state=JobState.TAR_SAVED)
+
+            # Wake up the worker that adds the Dockerfile
+            dockerfile_q.put(job.id)
+            return success()
+    return failure("No file was selected or file is not a .tar file.")
+
+
+@train_archives.teardown_app_request
+def remove_uploads(exc):
+    """
+    Removes the uploaded files of this request that have not been saved to a job
+    """
+    for upload in request.uploads:
+        upload.close()
+        if os.path.exists(upload.name):
+            os.remove(upload.name)
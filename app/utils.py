@@ -13,13 +13,12 @@ def fatal_if(test, message, status):
 
 
 def allowed_file(filename, ext):
-    return '.' in filename and \
-           filename.rsplit('.', 1)[1].lower() in [ext]
+    return filename.lower().endswith('.' + ext)
 
 
 def ensure_dir(filepath):
-    if not os.path.exists(filepath):
-        os.mkdir(filepath)
+    # Several gunicorn workers may create the directory at the same time
+    os.makedirs(filepath, exist_ok=True)
 
 
 POST_ONLY = ['POST']
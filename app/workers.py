@@ -0,0 +1,275 @@
+from concurrent.futures import ThreadPoolExecutor
+import queue
+import tarfile
+import threading
+import time
+import docker
+import os
+import sys
+import zlib
+from config import BUILD_CONTEXT_GZIP, DOCKER_SOCKET_PATH, DOCKERFILE, DOCKERFILE_BATCH, DOCKERFILE_WORKERS, \
+    PUSH_WORKERS, URI_REGISTRY
+from models import db, JobState, TrainArchiveJob, claim_jobs, job_ids_in_state, move_jobs, set_job_state, \
+    set_job_states
+
+
+###############################################################
+# Docker client
+################################################################
+docker_clients = threading.local()
+
+
+def get_docker_client():
+    """
+    Returns the Docker client of the calling thread. Each build/push worker keeps its own client,
+    so that its connection to the daemon is reused for all the jobs it processes
+    """
+    if not hasattr(docker_clients, 'client'):
+        docker_clients.client = docker.DockerClient(base_url='unix:/{}'.format(DOCKER_SOCKET_PATH))
+    return docker_clients.client
+
+
+def dockerfile_member():
+    """
+    Returns the tar member for the Dockerfile (header and padded content),
+    followed by a new end-of-archive marker
+    """
+    with open(DOCKERFILE, 'rb') as f:
+        content = f.read()
+        mtime = os.fstat(f.fileno()).st_mtime
+    info = tarfile.TarInfo('Dockerfile')
+    info.size = len(content)
+    info.mtime = int(mtime)
+    info.mode = 0o644
+    padding = b'\0' * (-len(content) % tarfile.BLOCKSIZE)
+    return info.tobuf() + content + padding + b'\0' * (2 * tarfile.BLOCKSIZE)
+
+
+# The Dockerfile is the same for all jobs, so it only needs to be turned into a tar member once
+DOCKERFILE_MEMBER = dockerfile_member()
+
+
+def gzip_chunks(f, chunk_size=1024 * 1024):
+    """
+    Yields the gzip compressed content of the file f chunk by chunk
+    """
+    compressor = zlib.compressobj(wbits=16 + zlib.MAX_WBITS)
+    for chunk in iter(lambda: f.read(chunk_size), b''):
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+##################################################################
+# Define the background jobs that this Flask application performs
+##################################################################
+def add_dockerfile(job: TrainArchiveJob):
+    """
+    Adds the Dockerfile to the tar file of the job
+    """
+    # The Dockerfile member overwrites the end-of-archive marker of the archive. Its offset is
+    # found by walking the member headers, seeking from the end of the file is not sufficient
+    # as tar files are often padded to a multiple of the record size
+    print("Add Dockerfile to Job: {}".format(job.id))
+    filepath = job.to_filepath()
+    with tarfile.open(filepath, 'r:') as tar:
+        members = tar.getmembers()
+        offset = tar.offset
+    fd = os.open(filepath, os.O_RDWR)
+    try:
+        # A retried job may already end with the Dockerfile member, it must not be added twice
+        member = DOCKERFILE_MEMBER[:-2 * tarfile.BLOCKSIZE]
+        if members and members[-1].name == 'Dockerfile' and \
+                os.pread(fd, len(member), members[-1].offset) == member:
+            print("Job {} already contains the Dockerfile".format(job.id))
+            return
+        os.pwrite(fd, DOCKERFILE_MEMBER, offset)
+    finally:
+        os.close(fd)
+    print("Dockerfile has been added to job to Job: {}".format(job.id))
+
+
+def build_push(job: TrainArchiveJob):
+    """
+    Builds the train image from the tar file of the job and pushes it to the registry
+    """
+    # Open the Tarfile of this job and use it as the build context for the generated Docker archive
+    repository = '{}/{}:immediate'.format(URI_REGISTRY, job.file_name)
+    docker_client = get_docker_client()
+    # The archive is streamed to the daemon, the build log is printed while the image is built.
+    # docker-py ignores gzip=True for custom contexts, so the archive is compressed here
+    with open(job.to_filepath(), 'rb') as f:
+        print("Building Image")
+        build_log = []
+        for line in docker_client.api.build(
+                fileobj=gzip_chunks(f) if BUILD_CONTEXT_GZIP else f,
+                custom_context=True,
+                encoding='gzip' if BUILD_CONTEXT_GZIP else None,
+                tag=repository,
+                decode=True):
+            build_log.append(line)
+            if 'stream' in line:
+                print(line['stream'], end='', flush=True)
+            if 'error' in line:
+                raise docker.errors.BuildError(line['error'], build_log)
+    print("Pushing to repository: {}".format(repository))
+    for line in docker_client.api.push(repository, stream=True, decode=True):
+        if 'error' in line:
+            raise docker.errors.DockerException(line['error'])
+    print("Push successful")
+
+
+def apply(func, job):
+    """
+    Applies the processor function to the job and returns whether it succeeded
+    """
+    try:
+        func(job)
+        return True
+    except Exception as e:
+        print("Processing Job {} failed: {}".format(job.id, e), file=sys.stderr)
+        return False
+
+
+def process_job(job_id, func, to_state):
+    """
+    Applies func to the job with the given id and moves it to to_state, or to FAILED
+    if func raises. The state transition is the only commit for this job
+    """
+    try:
+        job = db.session.query(TrainArchiveJob).get(job_id)
+        succeeded = apply(func, job)
+        set_job_state(job_id, to_state if succeeded else JobState.FAILED)
+        return succeeded
+    finally:
+        db.session.remove()
+
+
+def add_dockerfiles(job_ids):
+    """
+    Adds the Dockerfile to the jobs with the given ids in dockerfile_pool and returns the ids
+    of the jobs it has been added to. The state transitions of all jobs are committed at once
+    """
+    try:
+        jobs = db.session.query(TrainArchiveJob).filter(TrainArchiveJob.id.in_(job_ids)).all()
+        results = dockerfile_pool.map(apply, [add_dockerfile] * len(jobs), jobs)
+        job_states = {job.id: JobState.DOCKERFILE_ADDED if succeeded else JobState.FAILED
+                      for job, succeeded in zip(jobs, results)}
+        set_job_states(job_states)
+        return [job_id for job_id, state in job_states.items() if state == JobState.DOCKERFILE_ADDED]
+    finally:
+        db.session.remove()
+
+
+def dockerfile_worker(app):
+    """
+    Blocks on dockerfile_q and adds the Dockerfile to the jobs as soon as they are
+    put there, up to DOCKERFILE_BATCH jobs at once. Afterwards, the jobs are handed over to buildpush_q.
+    Job ids only enter dockerfile_q from index() and this is its sole consumer,
+    so the jobs do not need to be claimed first.
+    """
+    with app.app_context():
+        while True:
+            job_ids = [dockerfile_q.get()]
+            while len(job_ids) < DOCKERFILE_BATCH:
+                try:
+                    job_ids.append(dockerfile_q.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                for job_id in add_dockerfiles(job_ids):
+                    buildpush_q.put(job_id)
+            except Exception as e:
+                print("Processing Jobs {} failed: {}".format(job_ids, e), file=sys.stderr)
+
+                # Nothing else puts these jobs into dockerfile_q again, so they are retried later
+                time.sleep(RETRY_DELAY)
+                for job_id in job_ids:
+                    dockerfile_q.put(job_id)
+            finally:
+                for _ in job_ids:
+                    dockerfile_q.task_done()
+
+
+def build_push_job(app, job_id):
+    """
+    Builds and pushes the train image of the job in buildpush_pool, whose threads have no app context
+    """
+    # Nobody waits for the future of this function, so errors are logged here
+    try:
+        with app.app_context():
+            process_job(job_id, build_push, JobState.TRAIN_SUBMITTED)
+    except Exception as e:
+        print("Processing Job {} failed: {}".format(job_id, e), file=sys.stderr)
+
+
+def buildpush_worker(app):
+    """
+    Blocks on buildpush_q and submits up to PUSH_WORKERS jobs
+    with the Dockerfile added to the build/push pool.
+    """
+    with app.app_context():
+        while True:
+            buildpush_q.get()
+            try:
+                job_ids = claim_jobs(JobState.DOCKERFILE_ADDED, JobState.TRAIN_BEING_CREATED, PUSH_WORKERS)
+                for job_id in job_ids:
+                    buildpush_pool.submit(build_push_job, app, job_id)
+            except Exception as e:
+                print("Dispatching jobs failed: {}".format(e), file=sys.stderr)
+
+                # The jobs are still in DOCKERFILE_ADDED, wake up again later to claim them
+                time.sleep(RETRY_DELAY)
+                buildpush_q.put(None)
+            finally:
+                db.session.remove()
+                buildpush_q.task_done()
+
+
+##################################################################
+# Configure the workers
+##################################################################
+# Seconds to wait before jobs are retried after a worker failed to process them
+RETRY_DELAY = 1
+
+# Ids of jobs whose tar file has been saved
+dockerfile_q = queue.Queue()
+
+# Ids of jobs whose tar file contains the Dockerfile
+buildpush_q = queue.Queue()
+
+# Adds the Dockerfile to the tar files of a batch concurrently
+dockerfile_pool = ThreadPoolExecutor(max_workers=DOCKERFILE_WORKERS)
+
+# Builds and pushes the train images concurrently
+buildpush_pool = ThreadPoolExecutor(max_workers=PUSH_WORKERS)
+
+
+def start_workers(app):
+    """
+    Starts the background threads that process the jobs of the app
+    """
+    # Jobs left over from a previous run are never queued by index() again. A build/push that was
+    # interrupted is simply repeated, pushing the same tag again does no harm
+    with app.app_context():
+        move_jobs(JobState.TRAIN_BEING_CREATED, JobState.DOCKERFILE_ADDED)
+        for job_id in job_ids_in_state(JobState.TAR_SAVED):
+            dockerfile_q.put(job_id)
+
+        # Each wakeup claims at most PUSH_WORKERS jobs, so there is one wakeup per job
+        for _ in job_ids_in_state(JobState.DOCKERFILE_ADDED):
+            buildpush_q.put(None)
+        db.session.remove()
+
+    threading.Thread(
+        target=dockerfile_worker,
+        args=(app,),
+        name='Adds Dockerfile to the tar archive',
+        daemon=True).start()
+
+    threading.Thread(
+        target=buildpush_worker,
+        args=(app,),
+        name='Dispatches train images to be built and pushed',
+        daemon=True).start()